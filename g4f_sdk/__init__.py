@@ -6,7 +6,10 @@ A Python SDK for the g4f library with enhanced resilience and configuration.
 
 __version__ = "0.2.0" # Version bump to reflect major improvements
 
-from .client import G4FClient
+from typing import TYPE_CHECKING
+
+# Exceptions are lightweight and imported eagerly. G4FClient pulls in g4f and
+# is imported on first access instead (see __getattr__ below).
 from .exceptions import (
  G4FSDKError,
  ConfigurationError,
@@ -27,3 +30,17 @@ __all__ = [
  "ModelNotFoundError",
  "APIError",
 ]
+
+if TYPE_CHECKING:
+ from .client import G4FClient
+
+def __getattr__(name: str):
+ """Lazily imports G4FClient (PEP 562), so `import g4f_sdk` does not load g4f."""
+ if name == "G4FClient":
+  from .client import G4FClient
+  globals()["G4FClient"] = G4FClient # Later lookups bypass __getattr__
+  return G4FClient
+ raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+ return sorted(set(globals()) | set(__all__))
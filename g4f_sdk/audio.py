@@ -4,11 +4,14 @@ g4f_sdk/audio.py
 Handles audio transcription and synthesis with smart retries.
 """
 import asyncio
+import io
 import logging
-from typing import Optional, Any, TYPE_CHECKING
+from pathlib import Path
+from typing import Optional, Any, Dict, TYPE_CHECKING
 
-from .exceptions import APIError, ProviderError, RateLimitError, InvalidResponseError
-from .utils import async_retry
+from .exceptions import APIError, RateLimitError, InvalidResponseError
+from .providers import _resolve_provider
+from .utils import _PASSTHROUGH_EXCEPTIONS, _map_provider_exception, async_retry
 
 if TYPE_CHECKING:
     from .client import G4FClient
@@ -30,27 +33,31 @@ class AudioModule:
     # --- Transcription Methods ---
 
     @async_retry(
-        retries=3,
         retryable_exceptions=(RateLimitError, InvalidResponseError, asyncio.TimeoutError)
     )
-    async def _make_transcribe_call(self, provider: str, model: str, audio_file: Any, **kwargs) -> str:
-        """Core, decorated function for the g4f transcription API call."""
-        try:
-            response = await g4f.Stt.create_async(
-                model=model,
-                provider=getattr(g4f.Provider, provider),
-                file=audio_file,
-                timeout=self.config.timeout,
-                **kwargs
-            )
-            if not response or not isinstance(response, str):
-                raise InvalidResponseError("Provider returned an empty or invalid transcription.", provider)
-            return response
-        except Exception as e:
-            error_text = str(e).lower()
-            if "rate limit" in error_text:
-                raise RateLimitError(str(e), provider) from e
-            raise ProviderError(str(e), provider) from e
+    async def _make_transcribe_call(self, provider: str, audio_bytes: bytes, file_name: str, call_kwargs: Dict[str, Any]) -> str:
+        """
+        Core, decorated function for the g4f transcription API call.
+        `call_kwargs` is built once by the caller and reused on every attempt.
+        """
+        # A fresh file object per attempt, so a retry never sends a stream left at EOF.
+        audio_file = io.BytesIO(audio_bytes)
+        # Like an open file, carry the file name so providers can infer the audio format.
+        audio_file.name = file_name
+        async with self.client.request_limiter:
+            try:
+                response = await g4f.Stt.create_async(
+                    provider=_resolve_provider(provider),
+                    file=audio_file,
+                    **call_kwargs
+                )
+            except _PASSTHROUGH_EXCEPTIONS:
+                raise
+            except Exception as e:
+                raise _map_provider_exception(e, provider) from e
+        if not response or not isinstance(response, str):
+            raise InvalidResponseError("Provider returned an empty or invalid transcription.", provider)
+        return response
 
     async def transcribe(self, audio_path: str, model: Optional[str] = None, provider: Optional[str] = None, **kwargs) -> str:
         """Transcribes an audio file into text."""
@@ -60,16 +67,20 @@ class AudioModule:
         final_model = model or "whisper"
 
         try:
+            await self.client.providers._ensure_cache_async()
             selected_provider = self.client.providers._select_provider(final_model, provider)
-            logger.debug(f"Attempting transcription with provider '{selected_provider}' for model '{final_model}'")
-
-            with open(audio_path, "rb") as audio_file:
-                transcription_text = await self._make_transcribe_call(
-                    provider=selected_provider,
-                    model=final_model,
-                    audio_file=audio_file,
-                    **kwargs
-                )
+            logger.debug("Attempting transcription with provider '%s' for model '%s'", selected_provider, final_model)
+
+            # Read the file once, in a worker thread so the event loop is not blocked.
+            loop = asyncio.get_running_loop()
+            path = Path(audio_path)
+            audio_bytes = await loop.run_in_executor(None, path.read_bytes)
+
+            call_kwargs = {"model": final_model, "timeout": self.config.timeout}
+            # Unset options are left out so g4f applies its own defaults.
+            call_kwargs = {k: v for k, v in call_kwargs.items() if v is not None}
+            call_kwargs.update(kwargs)
+            transcription_text = await self._make_transcribe_call(selected_provider, audio_bytes, path.name, call_kwargs)
             return transcription_text
         except Exception as e:
             raise APIError(f"Failed to transcribe audio after all retries.", last_exception=e) from e
@@ -77,27 +88,26 @@ class AudioModule:
     # --- Text-to-Speech Methods ---
 
     @async_retry(
-        retries=3,
         retryable_exceptions=(RateLimitError, InvalidResponseError, asyncio.TimeoutError)
     )
-    async def _make_tts_call(self, provider: str, model: str, text: str, **kwargs) -> bytes:
-        """Core, decorated function for the g4f text-to-speech API call."""
-        try:
-            response = await g4f.Speech.create_async(
-                model=model,
-                provider=getattr(g4f.Provider, provider),
-                input=text,
-                timeout=self.config.timeout,
-                **kwargs
-            )
-            if not response or not isinstance(response, bytes):
-                raise InvalidResponseError("Provider returned empty or invalid audio data.", provider)
-            return response
-        except Exception as e:
-            error_text = str(e).lower()
-            if "rate limit" in error_text:
-                raise RateLimitError(str(e), provider) from e
-            raise ProviderError(str(e), provider) from e
+    async def _make_tts_call(self, provider: str, call_kwargs: Dict[str, Any]) -> bytes:
+        """
+        Core, decorated function for the g4f text-to-speech API call.
+        `call_kwargs` is built once by the caller and reused on every attempt.
+        """
+        async with self.client.request_limiter:
+            try:
+                response = await g4f.Speech.create_async(
+                    provider=_resolve_provider(provider),
+                    **call_kwargs
+                )
+            except _PASSTHROUGH_EXCEPTIONS:
+                raise
+            except Exception as e:
+                raise _map_provider_exception(e, provider) from e
+        if not response or not isinstance(response, bytes):
+            raise InvalidResponseError("Provider returned empty or invalid audio data.", provider)
+        return response
 
     async def text_to_speech(self, text: str, model: Optional[str] = None, provider: Optional[str] = None, **kwargs) -> bytes:
         """Converts text into speech audio."""
@@ -106,16 +116,26 @@ class AudioModule:
 
         final_model = model or "tts-1"
 
+        cache = self.client.response_cache
+        cache_key = cache.make_key("tts", final_model, provider, text, kwargs) if cache.enabled else None
+        if cache_key:
+            cached_audio = cache.get(cache_key)
+            if cached_audio is not None:
+                logger.debug("Returning cached speech audio.")
+                return cached_audio
+
         try:
+            await self.client.providers._ensure_cache_async()
             selected_provider = self.client.providers._select_provider(final_model, provider)
-            logger.debug(f"Attempting text-to-speech with provider '{selected_provider}' for model '{final_model}'")
-
-            audio_data = await self._make_tts_call(
-                provider=selected_provider,
-                model=final_model,
-                text=text,
-                **kwargs
-            )
+            logger.debug("Attempting text-to-speech with provider '%s' for model '%s'", selected_provider, final_model)
+
+            call_kwargs = {"model": final_model, "input": text, "timeout": self.config.timeout}
+            # Unset options are left out so g4f applies its own defaults.
+            call_kwargs = {k: v for k, v in call_kwargs.items() if v is not None}
+            call_kwargs.update(kwargs)
+            audio_data = await self._make_tts_call(selected_provider, call_kwargs)
+            if cache_key:
+                cache.set(cache_key, audio_data)
             return audio_data
         except Exception as e:
             raise APIError(f"Failed to synthesize speech after all retries.", last_exception=e) from e
\ No newline at end of file
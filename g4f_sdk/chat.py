@@ -5,29 +5,36 @@ Handles chat completion functionalities, including history management,
 smart retries, and token-based context trimming.
 """
 import asyncio
+import functools
 import logging
-from typing import List, Dict, Optional, Any, TYPE_CHECKING
+from typing import List, Dict, Optional, Any, Tuple, TYPE_CHECKING
 
-from .exceptions import APIError, ProviderError, RateLimitError, InvalidResponseError
-from .utils import async_retry, clean_response_ai
+from .exceptions import APIError, RateLimitError, InvalidResponseError
+from .providers import _resolve_provider
+from .utils import _PASSTHROUGH_EXCEPTIONS, _map_provider_exception, async_retry, clean_response_ai
 
 if TYPE_CHECKING:
  from .client import G4FClient
 
+logger = logging.getLogger(__name__)
+
 # --- Optional Tiktoken Import for accurate token counting ---
-try:
- import tiktoken
- # The 'cl100k_base' encoding is a sensible default that works for many popular models.
- tokenizer = tiktoken.get_encoding("cl100k_base")
- logger = logging.getLogger(__name__)
+@functools.lru_cache(maxsize=None)
+def _import_tiktoken() -> Optional[Any]:
+ """
+ Imports tiktoken the first time tokens are counted, rather than when the
+ SDK is imported. Returns None if it is not installed.
+ """
+ try:
+  import tiktoken
+ except ImportError:
+  logger.warning(
+   "Tiktoken library not found. `pip install tiktoken` for better history management. "
+   "Falling back to a less accurate character-based token estimation."
+  )
+  return None
  logger.debug("Tiktoken library found. Using for accurate token counting.")
-except ImportError:
- tokenizer = None
- logger = logging.getLogger(__name__)
- logger.warning(
-  "Tiktoken library not found. `pip install tiktoken` for better history management. "
-  "Falling back to a less accurate character-based token estimation."
- )
+ return tiktoken
 
 # --- g4f Library Import ---
 try:
@@ -35,14 +42,75 @@ try:
 except ImportError:
  g4f = None
 
-# --- Helper for Token Counting ---
-def _count_tokens(text: str) -> int:
- """Counts tokens in a string using tiktoken if available, otherwise estimates."""
+# Above this many characters, tokenization runs in a worker thread so it does not block the event loop.
+_OFFLOAD_TOKENIZE_CHARS = 8192
+
+# --- Helpers for Token Counting ---
+@functools.lru_cache(maxsize=8)
+def _get_encoding(name: str) -> Optional[Any]:
+ """
+ Returns a shared tiktoken encoding, loading it on first use.
+ Building an encoding parses its whole BPE table, so it is done once per name.
+ """
+ tiktoken = _import_tiktoken()
+ if not tiktoken:
+  return None
+ return tiktoken.get_encoding(name)
+
+@functools.lru_cache(maxsize=32)
+def _get_model_encoding(model: str) -> Optional[Any]:
+ """
+ Returns the tiktoken encoding used by a model, falling back to 'cl100k_base'
+ for models tiktoken does not know about.
+ """
+ tiktoken = _import_tiktoken()
+ if not tiktoken:
+  return None
+ try:
+  return tiktoken.encoding_for_model(model)
+ except KeyError:
+  # The 'cl100k_base' encoding is a sensible default that works for many popular models.
+  return _get_encoding("cl100k_base")
+
+def _message_text(msg: Dict[str, Any]) -> str:
+ """
+ Returns the text of a message for token counting. List-form (vision)
+ content is reduced to its text parts; other parts such as images are ignored.
+ """
+ content = msg.get("content") or ""
+ if isinstance(content, str):
+  return content
+ return "".join(part.get("text", "") for part in content if part.get("type") == "text")
+
+def _count_tokens_batch(texts: List[str], tokenizer: Optional[Any]) -> List[int]:
+ """
+ Counts tokens for several strings at once. With tiktoken this is a single
+ `encode_batch` call, which encodes the strings in parallel outside the GIL.
+ """
  if tokenizer:
-  return len(tokenizer.encode(text))
- else:
-  # Fallback: A rough estimation assuming 4 characters per token.
-  return len(text) // 4
+  return [len(tokens) for tokens in tokenizer.encode_batch(texts)]
+ # Fallback: A rough estimation assuming 4 characters per token.
+ return [len(text) // 4 for text in texts]
+
+def _trim_range(messages: List[Dict[str, str]], counts: List[int], max_tokens: int) -> Tuple[int, int, int]:
+ """
+ Works out which messages to drop so the rest fit within `max_tokens`.
+ A leading system prompt is always kept, along with as many of the most
+ recent messages as fit. `messages[start:cutoff]` is the span to drop.
+
+ :return: A `(start, cutoff, kept_tokens)` tuple.
+ """
+ # The system prompt is always kept, so its tokens count against the budget up front.
+ start = 1 if messages and messages[0]["role"] == "system" else 0
+ kept_tokens = counts[0] if start else 0
+
+ # Walk back from the newest message to find the oldest one that still fits.
+ cutoff = len(messages)
+ while cutoff > start and kept_tokens + counts[cutoff - 1] <= max_tokens:
+  cutoff -= 1
+  kept_tokens += counts[cutoff]
+
+ return start, cutoff, kept_tokens
 
 # --- ChatSession Class ---
 
@@ -51,11 +119,22 @@ class ChatSession:
  Manages an individual chat session, storing message history and handling
  context window trimming.
  """
+ # Sessions may be created per user or per request, so skip the per-instance __dict__.
+ __slots__ = ("client", "config", "model", "history", "_counted_messages", "_message_tokens", "_total_tokens", "_counts_version", "max_history_tokens")
+
  def __init__(self, client: 'G4FClient', model: Optional[str] = None, system_prompt: Optional[str] = None):
   self.client = client
   self.config = client.config
   self.model = model or self.config.default_model
   self.history: List[Dict[str, str]] = []
+  # The history messages counted so far and the token count of each, in step with the
+  # start of `history`, plus their running total. Only messages appended (or changed
+  # from outside the session) since the last trim ever need to be tokenized.
+  self._counted_messages: List[Dict[str, str]] = []
+  self._message_tokens: List[int] = []
+  self._total_tokens = 0
+  # Bumped whenever `_message_tokens` changes, so a count computed across an await can tell it went stale.
+  self._counts_version = 0
 
   # Get max tokens from config, with a sensible default.
   self.max_history_tokens = self.config.get("max_history_tokens", 4096)
@@ -63,38 +142,72 @@ class ChatSession:
   if system_prompt:
    self.history.append({"role": "system", "content": system_prompt})
 
- def _trim_history(self):
+ async def _count_messages(self, messages: List[Dict[str, str]]) -> List[int]:
+  """
+  Returns the token count of each message. The messages are tokenized
+  together in one batch, off the event loop if the batch is large.
+  """
+  texts = [_message_text(msg) for msg in messages]
+  tokenizer = _get_model_encoding(self.model)
+  if tokenizer and sum(map(len, texts)) > _OFFLOAD_TOKENIZE_CHARS:
+   loop = asyncio.get_running_loop()
+   return await loop.run_in_executor(None, _count_tokens_batch, texts, tokenizer)
+  return _count_tokens_batch(texts, tokenizer)
+
+ async def _update_token_counts(self):
+  """Counts the messages appended since the last call and adds them to the running total."""
+  while True:
+   # `get_history()` returns the live list, so callers may have removed or replaced messages.
+   # Counts are kept only for the leading messages that are still the same objects.
+   counted = self._counted_messages
+   limit = min(len(counted), len(self.history))
+   valid = 0
+   while valid < limit and counted[valid] is self.history[valid]:
+    valid += 1
+   if valid < len(counted):
+    del counted[valid:]
+    del self._message_tokens[valid:]
+    self._total_tokens = sum(self._message_tokens)
+    self._counts_version += 1
+
+   version = self._counts_version
+   new_messages = self.history[valid:]
+   if not new_messages:
+    return
+   new_counts = await self._count_messages(new_messages)
+   # A concurrent call on this session may have counted or trimmed meanwhile; if so, count again.
+   if self._counts_version == version:
+    counted.extend(new_messages)
+    self._message_tokens.extend(new_counts)
+    self._total_tokens += sum(new_counts)
+    self._counts_version += 1
+    return
+
+ async def _trim_history(self):
   """
   Trims the conversation history to stay within the `max_history_tokens` limit.
   It always preserves the system prompt (if any) and the most recent messages.
   """
-  total_tokens = sum(_count_tokens(msg["content"]) for msg in self.history)
+  await self._update_token_counts()
 
-  if total_tokens <= self.max_history_tokens:
+  if self._total_tokens <= self.max_history_tokens:
    return
 
-  # Separate system prompt to always keep it
-  system_prompt = None
-  if self.history and self.history[0]["role"] == "system":
-   system_prompt = self.history.pop(0)
+  start, cutoff, kept_tokens = _trim_range(self.history, self._message_tokens, self.max_history_tokens)
+  del self.history[start:cutoff]
+  del self._counted_messages[start:cutoff]
+  del self._message_tokens[start:cutoff]
+  self._total_tokens = kept_tokens
+  self._counts_version += 1
 
-  # Trim from the oldest messages until the token count is within the limit
-  while total_tokens > self.max_history_tokens and self.history:
-   removed_message = self.history.pop(0)
-   total_tokens -= _count_tokens(removed_message["content"])
-
-  # Add the system prompt back to the beginning
-  if system_prompt:
-   self.history.insert(0, system_prompt)
-
-  logger.debug(f"History trimmed to {total_tokens} tokens to fit within the {self.max_history_tokens} limit.")
+  logger.debug("History trimmed to %d tokens to fit within the %d limit.", kept_tokens, self.max_history_tokens)
 
  async def generate(self, msg: str, **kwargs) -> str:
   """
   Generates a response to a message, automatically managing history and trimming.
   """
   self.history.append({"role": "user", "content": msg})
-  self._trim_history() # Trim history *before* making the API call
+  await self._trim_history() # Trim history *before* making the API call
 
   response_text = await self.client.chat.generate(
    messages=self.history,
@@ -118,34 +231,51 @@ class ChatModule:
   self.config = client.config
 
  @async_retry(
-   retries=3, # This can be configured via a new config setting later
    retryable_exceptions=(RateLimitError, InvalidResponseError, asyncio.TimeoutError)
  )
- async def _make_api_call(self, provider: str, model: str, messages: List[Dict[str, str]], **kwargs) -> str:
+ async def _make_api_call(self, provider: str, call_kwargs: Dict[str, Any]) -> str:
   """
   The core, decorated function that makes the actual API call to g4f.
-  The @async_retry decorator handles the retry logic.
+  The @async_retry decorator handles the retry logic, so `call_kwargs` is
+  built once by the caller and reused as-is on every attempt.
   """
-  try:
-   response = await g4f.ChatCompletion.create_async(
-    model=model,
-    provider=getattr(g4f.Provider, provider),
-    messages=messages,
-    timeout=self.config.timeout,
-    proxy=self.config.proxy,
-    **kwargs
-   )
-   if not response or not isinstance(response, str):
-    raise InvalidResponseError(f"Provider returned an empty or invalid response: {type(response)}", provider)
-   return response
-  except Exception as e:
-   # Catch generic exceptions from g4f and wrap them in our custom exceptions
-   # to allow the retry decorator to work properly.
-   error_text = str(e).lower()
-   if "rate limit" in error_text:
-    raise RateLimitError(str(e), provider) from e
-   # Add more specific g4f error mappings here if needed
-   raise ProviderError(str(e), provider) from e
+  # The limiter is entered outside the error mapping, so its own errors are not mistaken for provider failures.
+  async with self.client.request_limiter:
+   try:
+    response = await g4f.ChatCompletion.create_async(
+     provider=_resolve_provider(provider),
+     **call_kwargs
+    )
+   except _PASSTHROUGH_EXCEPTIONS:
+    raise
+   except Exception as e:
+    # Catch generic exceptions from g4f and wrap them in our custom exceptions
+    # to allow the retry decorator to work properly.
+    raise _map_provider_exception(e, provider) from e
+  if not response or not isinstance(response, str):
+   raise InvalidResponseError(f"Provider returned an empty or invalid response: {type(response)}", provider)
+  return response
+
+ async def _complete(self, messages: List[Dict[str, str]], model: str, provider: Optional[str] = None, **kwargs) -> str:
+  """
+  Selects a provider and returns its raw completion for `messages`, with smart
+  retries but without response caching or cleaning. Failures are raised as-is.
+  """
+  await self.client.providers._ensure_cache_async()
+  selected_provider = self.client.providers._select_provider(model, provider)
+  logger.debug("Attempting chat completion with provider '%s' for model '%s'", selected_provider, model)
+
+  call_kwargs = {
+   "model": model,
+   "messages": messages,
+   "timeout": self.config.timeout,
+   "proxy": self.config.proxy,
+  }
+  # Unset options are left out so g4f applies its own defaults.
+  call_kwargs = {k: v for k, v in call_kwargs.items() if v is not None}
+  call_kwargs.update(kwargs)
+
+  return await self._make_api_call(selected_provider, call_kwargs)
 
  async def generate(self, messages: List[Dict[str, str]], model: Optional[str] = None, provider: Optional[str] = None, **kwargs) -> str:
   """
@@ -160,20 +290,22 @@ class ChatModule:
   final_model = model or self.config.default_model
   last_exception = None
 
-  try:
-   selected_provider = self.client.providers._select_provider(final_model, provider)
-   logger.debug(f"Attempting chat completion with provider '{selected_provider}' for model '{final_model}'")
+  cache = self.client.response_cache
+  cache_key = cache.make_key("chat", final_model, provider, messages, kwargs) if cache.enabled else None
+  if cache_key:
+   cached_text = cache.get(cache_key)
+   if cached_text is not None:
+    logger.debug("Returning cached chat completion.")
+    return cached_text
 
-   response_text = await self._make_api_call(
-     provider=selected_provider,
-     model=final_model,
-     messages=messages,
-     **kwargs
-   )
+  try:
+   response_text = await self._complete(messages, final_model, provider, **kwargs)
 
    if self.config.use_ai_cleaner:
-    return await clean_response_ai(self.client, response_text)
+    response_text = await clean_response_ai(self.client, response_text)
 
+   if cache_key:
+    cache.set(cache_key, response_text)
    return response_text
 
   except Exception as e:
@@ -182,3 +314,32 @@ class ChatModule:
   # If all retries inside _make_api_call fail, the last exception is raised.
   # We wrap it in a final APIError to signify total failure.
   raise APIError(f"Failed to get a response after all retries.", last_exception) from last_exception
+
+ async def generate_many(self, prompts: List[str], model: Optional[str] = None, provider: Optional[str] = None, max_concurrency: int = 5, **kwargs) -> List[str]:
+  """
+  Generates independent, single-turn responses for several prompts concurrently.
+
+  :param prompts: The user prompts to answer. Each one is sent as its own conversation.
+  :param max_concurrency: Maximum number of requests in flight at the same time. Must be at least 1.
+  :return: The responses, in the same order as `prompts`.
+  :raises ValueError: If `max_concurrency` is below 1.
+  :raises APIError: If any of the prompts fails after all retries. The remaining requests are cancelled.
+  """
+  if max_concurrency < 1:
+   raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}.")
+  semaphore = asyncio.Semaphore(max_concurrency)
+
+  async def generate_one(prompt: str) -> str:
+   async with semaphore:
+    return await self.generate([{"role": "user", "content": prompt}], model=model, provider=provider, **kwargs)
+
+  tasks = [asyncio.ensure_future(generate_one(prompt)) for prompt in prompts]
+  try:
+   return list(await asyncio.gather(*tasks))
+  except BaseException:
+   # gather does not cancel the other prompts when one fails, so stop them here
+   # and wait for them to finish unwinding before the error propagates.
+   for task in tasks:
+    task.cancel()
+   await asyncio.gather(*tasks, return_exceptions=True)
+   raise
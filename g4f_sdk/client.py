@@ -28,6 +28,8 @@ class G4FClient:
 
   # 3. Initialize core modules, passing a reference to this client instance
   self.providers = ProviderManager(self.config)
+  self.response_cache = utils.ResponseCache(self.config.response_cache_size, self.config.response_cache_ttl)
+  self.request_limiter = utils.ConcurrencyLimiter(self.config.max_concurrent_requests)
   self.chat = ChatModule(self)
   self.images = ImageModule(self)
   self.audio = AudioModule(self)
@@ -4,10 +4,22 @@ g4f_sdk/config.py
 Manages the SDK's configuration with a clear priority system.
 """
 import os
+import copy
 import json
 import logging
+import functools
 from typing import Optional, Dict, List, Any
 
+@functools.lru_cache(maxsize=16)
+def _read_config_file(path: str, mtime_ns: int) -> Dict[str, Any]:
+ """
+ Reads and parses a JSON config file. Results are cached by absolute path and
+ modification time, so clients sharing a file parse it once until it changes.
+ The returned dict is shared between callers and must not be mutated.
+ """
+ with open(path, 'r') as f:
+  return json.load(f)
+
 class Config:
  """
  Manages all configuration settings for the SDK.
@@ -16,6 +28,25 @@ class Config:
  2. Settings from a JSON config file.
  3. Default values defined here (lowest).
  """
+ # Every setting is declared here; unknown keys from kwargs or the config file are ignored.
+ __slots__ = (
+  "log_level",
+  "default_model",
+  "timeout",
+  "retries",
+  "retry_delay",
+  "retry_backoff_factor",
+  "max_concurrent_requests",
+  "provider_cache_ttl",
+  "preferred_providers",
+  "use_ai_cleaner",
+  "max_history_tokens",
+  "response_cache_size",
+  "response_cache_ttl",
+  "proxy",
+  "api_key",
+ )
+
  def __init__(self, config_path: Optional[str] = None, **kwargs: Any):
   # --- Default Settings ---
   # Logging
@@ -30,6 +61,9 @@ class Config:
   self.retry_delay: float = 2.0
   self.retry_backoff_factor: float = 2.0
 
+  # Concurrency
+  self.max_concurrent_requests: Optional[int] = None # Max provider calls in flight per client; None for no limit
+
   # Provider selection
   self.provider_cache_ttl: int = 86400 # 24 hours
   self.preferred_providers: Optional[List[str]] = None
@@ -38,6 +72,10 @@ class Config:
   self.use_ai_cleaner: bool = False
   self.max_history_tokens: int = 4096 # Max tokens for chat history before trimming
 
+  # Response caching
+  self.response_cache_size: int = 0 # Max cached responses; 0 disables the cache
+  self.response_cache_ttl: int = 300 # 5 minutes
+
   # Network
   self.proxy: Optional[Dict[str, str]] = None
   self.api_key: Optional[str] = None
@@ -47,26 +85,33 @@ class Config:
 
   # --- Override from kwargs (highest priority) ---
   for key, value in kwargs.items():
-   if hasattr(self, key):
+   if key in _SETTING_NAMES:
     setattr(self, key, value)
 
  def _load_from_file(self, config_path: Optional[str]):
   """Loads configuration from a .json file if it exists."""
   path_to_check = config_path or "g4f_sdk_config.json"
-  if not os.path.exists(path_to_check):
+  abs_path = os.path.abspath(path_to_check)
+  # A single stat both checks that the file exists and provides the cache key.
+  try:
+   mtime_ns = os.stat(abs_path).st_mtime_ns
+  except OSError:
    if config_path: # Warn only if a specific path was given and not found
     logging.warning(f"Configuration file not found: {config_path}")
    return
 
   try:
-   with open(path_to_check, 'r') as f:
-    config_data = json.load(f)
+   # The parsed file is shared by every client, so each Config gets its own copy of its lists and dicts.
+   config_data = copy.deepcopy(_read_config_file(abs_path, mtime_ns))
    for key, value in config_data.items():
-    if hasattr(self, key):
+    if key in _SETTING_NAMES:
      setattr(self, key, value)
-  except (IOError, json.JSONDecodeError) as e:
+  except (OSError, json.JSONDecodeError) as e:
    logging.error(f"Failed to load or parse config file {path_to_check}: {e}")
 
  def get(self, key: str, default: Any = None) -> Any:
   """Safely gets a configuration value."""
-  return getattr(self, key, default)
+  # Settings live in slots, so check the name first rather than relying on getattr's fallback.
+  return getattr(self, key) if key in _SETTING_NAMES else default
+
+_SETTING_NAMES = frozenset(Config.__slots__)
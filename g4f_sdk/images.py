@@ -5,10 +5,11 @@ Handles image generation functionalities with smart retries.
 """
 import asyncio
 import logging
-from typing import Optional, List, Any, TYPE_CHECKING
+from typing import Optional, List, Any, Dict, TYPE_CHECKING
 
-from .exceptions import APIError, ProviderError, RateLimitError, InvalidResponseError
-from .utils import async_retry
+from .exceptions import APIError, RateLimitError, InvalidResponseError
+from .providers import _resolve_provider
+from .utils import _PASSTHROUGH_EXCEPTIONS, _map_provider_exception, async_retry
 
 if TYPE_CHECKING:
     from .client import G4FClient
@@ -28,28 +29,26 @@ class ImageModule:
         self.config = client.config
 
     @async_retry(
-        retries=3,
         retryable_exceptions=(RateLimitError, InvalidResponseError, asyncio.TimeoutError)
     )
-    async def _make_api_call(self, provider: str, model: str, prompt: str, **kwargs) -> List[str]:
-        """The core, decorated function for the g4f image generation API call."""
-        try:
-            response = await g4f.Image.create_async(
-                model=model,
-                provider=getattr(g4f.Provider, provider),
-                prompt=prompt,
-                proxy=self.config.proxy,
-                timeout=self.config.timeout,
-                **kwargs
-            )
-            if not response or not isinstance(response, list) or not response[0]:
-                raise InvalidResponseError("Provider returned an empty or invalid list of images.", provider)
-            return response
-        except Exception as e:
-            error_text = str(e).lower()
-            if "rate limit" in error_text:
-                raise RateLimitError(str(e), provider) from e
-            raise ProviderError(str(e), provider) from e
+    async def _make_api_call(self, provider: str, call_kwargs: Dict[str, Any]) -> List[str]:
+        """
+        The core, decorated function for the g4f image generation API call.
+        `call_kwargs` is built once by the caller and reused on every attempt.
+        """
+        async with self.client.request_limiter:
+            try:
+                response = await g4f.Image.create_async(
+                    provider=_resolve_provider(provider),
+                    **call_kwargs
+                )
+            except _PASSTHROUGH_EXCEPTIONS:
+                raise
+            except Exception as e:
+                raise _map_provider_exception(e, provider) from e
+        if not response or not isinstance(response, list) or not response[0]:
+            raise InvalidResponseError("Provider returned an empty or invalid list of images.", provider)
+        return response
 
     async def generate(self, prompt: str, model: Optional[str] = None, provider: Optional[str] = None, **kwargs) -> str:
         """
@@ -61,17 +60,32 @@ class ImageModule:
 
         final_model = model or "dall-e-3" # A reasonable default for images
 
+        cache = self.client.response_cache
+        cache_key = cache.make_key("image", final_model, provider, prompt, kwargs) if cache.enabled else None
+        if cache_key:
+            cached_url = cache.get(cache_key)
+            if cached_url is not None:
+                logger.debug("Returning cached image URL.")
+                return cached_url
+
         try:
+            await self.client.providers._ensure_cache_async()
             selected_provider = self.client.providers._select_provider(final_model, provider)
-            logger.debug(f"Attempting image generation with provider '{selected_provider}' for model '{final_model}'")
+            logger.debug("Attempting image generation with provider '%s' for model '%s'", selected_provider, final_model)
 
-            image_urls = await self._make_api_call(
-                provider=selected_provider,
-                model=final_model,
-                prompt=prompt,
-                **kwargs
-            )
+            call_kwargs = {
+                "model": final_model,
+                "prompt": prompt,
+                "proxy": self.config.proxy,
+                "timeout": self.config.timeout,
+            }
+            # Unset options are left out so g4f applies its own defaults.
+            call_kwargs = {k: v for k, v in call_kwargs.items() if v is not None}
+            call_kwargs.update(kwargs)
+            image_urls = await self._make_api_call(selected_provider, call_kwargs)
 
+            if cache_key:
+                cache.set(cache_key, image_urls[0])
             # Return the first image URL from the list
             return image_urls[0]
 
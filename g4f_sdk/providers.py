@@ -3,10 +3,14 @@ g4f_sdk/providers.py
 
 Manages, caches, and intelligently selects providers.
 """
+import asyncio
 import time
 import random
 import logging
-from typing import List, Optional, Dict, Any
+import functools
+import threading
+import weakref
+from typing import List, Optional, Dict, Any, FrozenSet
 
 from .exceptions import ProviderError
 
@@ -17,6 +21,39 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=256)
+def _resolve_provider(name: str) -> Any:
+ """
+ Resolves a provider name to its g4f provider class, once per name until
+ the provider cache is next refreshed. Shared by the chat, image and audio
+ modules for their API calls.
+ """
+ return getattr(g4f.Provider, name)
+
+def _class_attr(cls: type, name: str, default: Any) -> Any:
+ """
+ Reads a class attribute from the class's own namespace dict when it is defined
+ there as a plain value, skipping the MRO walk. Inherited attributes and
+ descriptors fall back to `getattr`.
+ """
+ cls_dict = vars(cls)
+ if name in cls_dict:
+  value = cls_dict[name]
+  if not hasattr(type(value), "__get__"):
+   return value
+ return getattr(cls, name, default)
+
+def _normalize_models(models: Any) -> FrozenSet[str]:
+ """
+ Normalizes the models a provider advertises, a single name or a list of names,
+ to a frozenset so support checks are a single hash lookup with no type dispatch.
+ """
+ if isinstance(models, str):
+  return frozenset((models,))
+ if isinstance(models, list):
+  return frozenset(models)
+ return frozenset()
+
 class ProviderManager:
  """
  Manages the list of available providers and selects the best one for a given task.
@@ -25,6 +62,18 @@ class ProviderManager:
   self.config = config
   self._providers_info: Dict[str, Dict[str, Any]] = {}
   self._last_fetch_time: float = 0
+  # Inverted index of the working providers that explicitly support each model, rebuilt on every refresh.
+  self._model_index: Dict[str, List[str]] = {}
+  # Serializes refreshes so concurrent first use introspects g4f only once.
+  self._refresh_lock = threading.Lock()
+  # Refresh running in the event loop's executor while stale providers are served.
+  self._background_refresh: Optional[asyncio.Future] = None
+  # Coalesce cold-start refreshes awaited by coroutines. One lock per event loop, created
+  # on first use there: a lock cannot be shared across loops, and a client may outlive
+  # several `asyncio.run` calls.
+  self._async_refresh_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+  # Random source for provider selection, independent of the module-level generator.
+  self._rng = random.Random()
 
  def _is_cache_valid(self) -> bool:
   """Checks if the provider cache is still valid based on TTL."""
@@ -38,25 +87,90 @@ class ProviderManager:
    return
 
   logger.info("Refreshing provider cache from g4f library...")
-  self._providers_info.clear()
-
-  for provider_name in dir(g4f.Provider):
-   if not provider_name.startswith("__"):
-    provider_class = getattr(g4f.Provider, provider_name)
-    if isinstance(provider_class, type) and getattr(provider_class, "working", False):
-     self._providers_info[provider_name] = {
-      "name": provider_name,
-      "working": True,
-      "models": getattr(provider_class, "model", None)
-     }
-
+  # The new cache is built off to the side and swapped in at the end, so concurrent
+  # readers see either the old providers or the new ones, never a half-built cache.
+  providers_info: Dict[str, Dict[str, Any]] = {}
+  model_index: Dict[str, List[str]] = {}
+
+  # The module's namespace dict is read directly; dir() would build and sort a list of every name.
+  for provider_name, provider_class in vars(g4f.Provider).items():
+   if not provider_name.startswith("__") and isinstance(provider_class, type) and _class_attr(provider_class, "working", False):
+    models = _normalize_models(_class_attr(provider_class, "model", None))
+    providers_info[provider_name] = {
+     "name": provider_name,
+     "working": True,
+     "models": models
+    }
+    for model in models:
+     model_index.setdefault(model, []).append(provider_name)
+
+  self._providers_info = providers_info
+  self._model_index = model_index
+  # Provider classes may have been replaced since the last refresh.
+  _resolve_provider.cache_clear()
   self._last_fetch_time = time.time()
-  logger.info(f"Cache updated. Found {len(self._providers_info)} working providers.")
+  logger.info(f"Cache updated. Found {len(providers_info)} working providers.")
+
+ def _refresh(self):
+  """Refreshes the provider cache unless another caller already has."""
+  with self._refresh_lock:
+   # Another caller may have refreshed the cache while we waited for the lock.
+   if not self._is_cache_valid():
+    self._fetch_from_g4f()
+
+ def _refresh_in_background(self):
+  """Runs a refresh from the executor, logging failures instead of raising them."""
+  try:
+   self._refresh()
+  except Exception as e:
+   logger.warning("Background provider cache refresh failed: %s", e)
 
  def _ensure_cache(self):
-  """Ensures the provider cache is fresh before use."""
-  if not self._is_cache_valid():
-   self._fetch_from_g4f()
+  """
+  Ensures the provider cache is usable before use.
+  Once the TTL expires, callers inside an event loop keep getting the previous
+  providers while a single refresh runs in the loop's executor. Only an empty
+  cache, or a call made outside an event loop, waits for the refresh.
+  """
+  if self._is_cache_valid():
+   return
+
+  if self._providers_info:
+   try:
+    loop = asyncio.get_running_loop()
+   except RuntimeError:
+    loop = None
+   if loop is not None:
+    pending = self._background_refresh
+    # A refresh left pending by an event loop that has since closed never completes, so it is not waited on.
+    if pending is None or pending.done() or pending.get_loop() is not loop:
+     self._background_refresh = loop.run_in_executor(None, self._refresh_in_background)
+    return
+
+  self._refresh()
+
+ async def _ensure_cache_async(self):
+  """
+  Async counterpart of `_ensure_cache` for the modules' request paths.
+  A cold-start refresh runs in the event loop's executor instead of blocking
+  the loop, and coroutines arriving meanwhile wait for that one refresh.
+  """
+  if self._is_cache_valid() or self._providers_info:
+   self._ensure_cache()
+   return
+
+  loop = asyncio.get_running_loop()
+  lock = self._async_refresh_locks.get(loop)
+  if lock is None:
+   lock = self._async_refresh_locks[loop] = asyncio.Lock()
+  async with lock:
+   # Another coroutine may have refreshed the cache while we waited for the lock.
+   if not self._is_cache_valid():
+    await loop.run_in_executor(None, self._refresh)
+
+ def _providers_for_model(self, model: str) -> List[str]:
+  """Returns the working providers that explicitly support a model, from the index."""
+  return self._model_index.get(model, [])
 
  def _select_provider(self, model: str, provider_hint: Optional[str] = None) -> str:
   """
@@ -70,40 +184,35 @@ class ProviderManager:
   5. As a final fallback, choose a random working provider.
   """
   self._ensure_cache()
+  # One snapshot of the cache for the whole selection, even if a refresh swaps it meanwhile.
+  providers_info = self._providers_info
 
   if provider_hint:
-   if provider_hint in self._providers_info:
+   if provider_hint in providers_info:
     return provider_hint
    else:
     raise ProviderError(f"Specified provider '{provider_hint}' is not available or not working.")
 
-  working_providers = list(self._providers_info.keys())
-  if not working_providers:
+  if not providers_info:
    raise ProviderError("No working providers found in the cache.")
 
-  def check_model_support(provider_name: str) -> bool:
-   """Checks if a provider explicitly supports the model."""
-   provider_models = self._providers_info[provider_name].get("models")
-   if isinstance(provider_models, str):
-    return provider_models == model
-   if isinstance(provider_models, list):
-    return model in provider_models
-   return False
+  supporting_providers = self._providers_for_model(model)
 
   # 1. & 2. Find candidates from preferred list first
   preferred = self.config.preferred_providers or []
-  candidates = [p for p in preferred if p in working_providers and check_model_support(p)]
+  # Membership is checked against the cache's dicts and model sets, not by scanning lists.
+  candidates = [p for p in preferred if p in providers_info and model in providers_info[p]["models"]]
 
   # 3. Find candidates from all working providers
   if not candidates:
-   candidates = [p for p in working_providers if check_model_support(p)]
+   candidates = supporting_providers
 
   # 4. Fallback to any preferred provider
   if not candidates and preferred:
-   candidates = [p for p in preferred if p in working_providers]
+   candidates = [p for p in preferred if p in providers_info]
 
   # 5. Fallback to any working provider
   if not candidates:
-   candidates = working_providers
+   candidates = list(providers_info)
 
-  return random.choice(candidates)
\ No newline at end of file
+  return self._rng.choice(candidates)
\ No newline at end of file
@@ -2,15 +2,21 @@
 g4f_sdk/utils.py
 
 Core utilities for the SDK, including a smart retry decorator,
-logging setup, and response cleaning functions.
+logging setup, response caching, and response cleaning functions.
 """
 import asyncio
+import hashlib
+import json
 import logging
+import random
 import re
-from functools import wraps
-from typing import Callable, Any, Coroutine, Tuple, Type, TYPE_CHECKING
+import time
+import weakref
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from typing import Callable, Any, Coroutine, Optional, Tuple, Type, TYPE_CHECKING
 
-from .exceptions import RateLimitError, InvalidResponseError
+from .exceptions import G4FSDKError, ProviderError, RateLimitError, InvalidResponseError
 
 if TYPE_CHECKING:
   from .client import G4FClient
@@ -20,17 +26,27 @@ logger = logging.getLogger(__name__)
 
 # --- Logging Setup ---
 
+# Set once the SDK's handler has been considered, so later calls only adjust the level.
+_LOGGING_CONFIGURED = False
+
 def setup_logging(level: str = "INFO"):
   """
   Configures basic logging for the SDK.
-  Avoids adding duplicate handlers if logging is already configured.
+  The handler is set up on the first call only, and not at all if SDK logs
+  already reach a handler configured by the host application.
+  Later calls just update the level.
   """
+  global _LOGGING_CONFIGURED
   log_level = getattr(logging, level.upper(), logging.INFO)
   root_logger = logging.getLogger("g4f_sdk")
+  root_logger.setLevel(log_level)
+
+  if _LOGGING_CONFIGURED:
+    return
+  _LOGGING_CONFIGURED = True
 
-  # Check if handlers are already configured for our logger to avoid duplication
-  if not root_logger.handlers:
-    root_logger.setLevel(log_level)
+  # Check for handlers on our logger or its ancestors to avoid duplication
+  if not root_logger.hasHandlers():
     handler = logging.StreamHandler()
     formatter = logging.Formatter(
       "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -43,9 +59,11 @@ def setup_logging(level: str = "INFO"):
 # --- Smart Retry Decorator ---
 
 def async_retry(
-  retries: int = 3,
-  delay: float = 2.0,
-  backoff_factor: float = 2.0,
+  retries: Optional[int] = None,
+  delay: Optional[float] = None,
+  backoff_factor: Optional[float] = None,
+  jitter: float = 0.5,
+  max_delay: float = 30.0,
   retryable_exceptions: Tuple[Type[Exception], ...] = (
     RateLimitError,
     InvalidResponseError,
@@ -55,41 +73,200 @@ def async_retry(
 ) -> Callable[..., Coroutine[Any, Any, Any]]:
   """
   A decorator for retrying an async function with exponential backoff.
+  Each delay is randomized by up to `jitter` times its nominal value in either
+  direction (0.5x to 1.5x by default) so that concurrent callers do not retry
+  in lockstep. No single sleep is longer than `max_delay` seconds.
+
+  Settings left as None are read on each call from the `config` of the
+  decorated method's instance (`retries`, `retry_delay`, `retry_backoff_factor`),
+  falling back to 3 retries, a 2 second delay and a backoff factor of 2.
 
   It only retries on exceptions specified in `retryable_exceptions`.
   All other exceptions are raised immediately.
   """
+  # The exact listed types are classified with one set lookup; subclasses fall back to isinstance.
+  exact_retryable = frozenset(retryable_exceptions)
+
   def decorator(func: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Coroutine[Any, Any, Any]]:
     @wraps(func)
     async def wrapper(*args: Any, **kwargs: Any) -> Any:
-      current_delay = delay
-      for attempt in range(retries + 1):
+      config = getattr(args[0], "config", None) if args else None
+      max_retries = retries if retries is not None else getattr(config, "retries", 3)
+      current_delay = delay if delay is not None else getattr(config, "retry_delay", 2.0)
+      factor = backoff_factor if backoff_factor is not None else getattr(config, "retry_backoff_factor", 2.0)
+
+      attempts_total = max_retries + 1
+
+      for attempt in range(1, attempts_total + 1):
         try:
           return await func(*args, **kwargs)
-        except retryable_exceptions as e:
-          if attempt == retries:
+        except Exception as e:
+          if type(e) not in exact_retryable and not isinstance(e, retryable_exceptions):
+            # Non-retryable exceptions are raised immediately
             logger.error(
-              f"Function '{func.__name__}' failed after {retries + 1} attempts. Last error: {e}"
+              "Function '%s' failed with a non-retryable error: %s",
+              func.__name__, e
             )
-            raise e from e
+            raise
 
+          if attempt == attempts_total:
+            logger.error(
+              "Function '%s' failed after %d attempts. Last error: %s",
+              func.__name__, attempts_total, e
+            )
+            raise
+
+          sleep_for = min(current_delay * (1 + jitter * (2 * random.random() - 1)), max_delay)
           logger.warning(
-            f"Function '{func.__name__}' failed with a retryable error (Attempt {attempt + 1}/{retries + 1}): {e}. "
-            f"Retrying in {current_delay:.2f} seconds..."
+            "Function '%s' failed with a retryable error (Attempt %d/%d): %s. Retrying in %.2f seconds...",
+            func.__name__, attempt, attempts_total, e, sleep_for
           )
-          await asyncio.sleep(current_delay)
-          current_delay *= backoff_factor
-        except Exception as e:
-          # Non-retryable exceptions are raised immediately
-          logger.error(
-            f"Function '{func.__name__}' failed with a non-retryable error: {e}"
-          )
-          raise e
+          await asyncio.sleep(sleep_for)
+          current_delay = min(current_delay * factor, max_delay)
     return wrapper
   return decorator
 
+# --- Provider Error Mapping ---
+
+# Matches the wording providers use for rate-limit errors, without lowercasing the message.
+_RATE_LIMIT_RE = re.compile(r"rate[\s_-]?limit|quota|too many requests|\b429\b", re.IGNORECASE)
+
+# Exceptions that the `_make_*` API-call wrappers re-raise unchanged, so that
+# the retry decorator still sees SDK errors and timeouts by their own type.
+_PASSTHROUGH_EXCEPTIONS = (G4FSDKError, asyncio.TimeoutError)
+
+@lru_cache(maxsize=None)
+def _g4f_rate_limit_errors() -> Tuple[Type[Exception], ...]:
+  """
+  Returns g4f's own rate-limit exception type, where the installed version provides one.
+  Imported on first use so that importing this module does not import g4f.
+  """
+  try:
+    from g4f.errors import RateLimitError as G4FRateLimitError
+  except ImportError:
+    return ()
+  return (G4FRateLimitError,)
+
+def _map_provider_exception(e: Exception, provider: str) -> ProviderError:
+  """
+  Wraps an exception raised by g4f in the matching SDK exception:
+  a retryable `RateLimitError` for rate limits, otherwise a `ProviderError`.
+  g4f's own rate-limit exception is recognised by type before the message is searched.
+  """
+  error_text = str(e)
+  if isinstance(e, _g4f_rate_limit_errors()) or _RATE_LIMIT_RE.search(error_text):
+    return RateLimitError(error_text, provider)
+  # Add more specific g4f error mappings here if needed
+  return ProviderError(error_text, provider)
+
+# --- Concurrency Limiting ---
+
+class ConcurrencyLimiter:
+  """
+  An async context manager that caps how many provider calls run at once.
+  A `limit` of None (or 0) means no cap.
+  """
+  def __init__(self, limit: Optional[int] = None):
+    self.limit = limit
+    # One semaphore per event loop, created on first use there. A semaphore cannot
+    # be shared across loops, and a client may outlive several `asyncio.run` calls.
+    self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+  def _semaphore(self) -> asyncio.Semaphore:
+    """Returns the semaphore for the running event loop, creating it if needed."""
+    loop = asyncio.get_running_loop()
+    semaphore = self._semaphores.get(loop)
+    if semaphore is None:
+      semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+    return semaphore
+
+  async def __aenter__(self):
+    if self.limit:
+      await self._semaphore().acquire()
+
+  async def __aexit__(self, *exc_info: Any):
+    if self.limit:
+      self._semaphore().release()
+
+# --- Response Caching ---
+
+class ResponseCache:
+  """
+  An in-memory LRU cache for API responses, with a time-to-live per entry.
+  A `max_size` of 0 disables caching entirely.
+  """
+  def __init__(self, max_size: int = 0, ttl: float = 300.0):
+    self.max_size = max_size
+    self.ttl = ttl
+    self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+  @property
+  def enabled(self) -> bool:
+    return self.max_size > 0
+
+  @staticmethod
+  def make_key(*parts: Any) -> str:
+    """Builds a stable key from JSON-serializable request parts (task, model, messages, ...)."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+  def get(self, key: str) -> Optional[Any]:
+    """Returns the cached value for `key`, or None if it is missing or expired."""
+    entry = self._entries.get(key)
+    if entry is None:
+      return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+      del self._entries[key]
+      return None
+    self._entries.move_to_end(key)
+    return value
+
+  def set(self, key: str, value: Any):
+    """Stores a value, evicting the least recently used entries beyond `max_size`."""
+    if not self.enabled:
+      return
+    self._entries[key] = (time.monotonic() + self.ttl, value)
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_size:
+      self._entries.popitem(last=False)
+
+  def clear(self):
+    """Removes all cached responses."""
+    self._entries.clear()
+
 # --- Response Cleaning ---
 
+# Kept byte-identical across calls so providers with prompt caching can reuse it.
+_AI_CLEANER_SYSTEM_PROMPT = (
+  "You are a text cleaning expert. Your task is to remove any "
+  "provider-specific artifacts, ads, disclaimers, or metadata from the given text. "
+  "Return only the clean, core message that the user requested. Do not add any "
+  "of your own commentary or introductions. Just return the cleaned text."
+)
+_AI_CLEANER_SYSTEM_MESSAGE = {"role": "system", "content": _AI_CLEANER_SYSTEM_PROMPT}
+
+# Common disclaimer patterns. Each runs to the end of the text, so they are fused
+# into one alternation that cuts the text at the earliest match in a single scan.
+_DISCLAIMER_PATTERNS = (
+  r"as an ai language model,\s*i cannot.*",
+  r"i am not able to.*",
+  r"i'm just an ai and do not have.*",
+  r"disclaimer:.*",
+  # Add more specific provider artifacts here as they are discovered
+)
+_DISCLAIMER_RE = re.compile("|".join(f"(?:{p})" for p in _DISCLAIMER_PATTERNS), re.IGNORECASE | re.DOTALL)
+# The literal, lowercase text each pattern starts with; keep in step with the patterns above.
+# Plain substring checks on these let text without any of them skip the regex.
+_DISCLAIMER_MARKERS = (
+  "as an ai language model,",
+  "i am not able to",
+  "i'm just an ai and do not have",
+  "disclaimer:",
+)
+_MULTISPACE_RE = re.compile(r'\s{2,}')
+_MULTINEWLINE_RE = re.compile(r'\n{3,}')
+
 def _clean_response_programmatic(text: str) -> str:
   """
   Performs basic, rule-based cleaning of the response text.
@@ -99,20 +276,18 @@ def _clean_response_programmatic(text: str) -> str:
     return ""
 
   # 1. Remove common disclaimer patterns
-  patterns = [
-    r"as an ai language model,\s*i cannot.*",
-    r"i am not able to.*",
-    r"i'm just an ai and do not have.*",
-    r"disclaimer:.*",
-    # Add more specific provider artifacts here as they are discovered
-  ]
-  cleaned_text = text
-  for pattern in patterns:
-    cleaned_text = re.sub(pattern, "", cleaned_text, flags=re.IGNORECASE | re.DOTALL).strip()
+  # Only ASCII text is prechecked: there, lower() matches the regex's case-insensitivity exactly.
+  if text.isascii():
+    lowered = text.lower()
+    has_marker = any(marker in lowered for marker in _DISCLAIMER_MARKERS)
+  else:
+    has_marker = True
+  cleaned_text = (_DISCLAIMER_RE.sub("", text) if has_marker else text).strip()
 
   # 2. Normalize whitespace
-  cleaned_text = re.sub(r'\s{2,}', ' ', cleaned_text) # Replace multiple spaces with one
-  cleaned_text = re.sub(r'\n{3,}', '\n\n', cleaned_text) # Replace multiple newlines with two
+  cleaned_text = _MULTISPACE_RE.sub(' ', cleaned_text) # Replace multiple spaces with one
+  if "\n\n\n" in cleaned_text:
+    cleaned_text = _MULTINEWLINE_RE.sub('\n\n', cleaned_text) # Replace multiple newlines with two
 
   return cleaned_text.strip()
 
@@ -124,23 +299,17 @@ async def clean_response_ai(client: 'G4FClient', text_to_clean: str) -> str:
   if not text_to_clean:
     return ""
 
-  system_prompt = (
-    "You are a text cleaning expert. Your task is to remove any "
-    "provider-specific artifacts, ads, disclaimers, or metadata from the given text. "
-    "Return only the clean, core message that the user requested. Do not add any "
-    "of your own commentary or introductions. Just return the cleaned text."
-  )
-
   try:
-    # Use a temporary, isolated chat session for the cleaning task
-    # to not interfere with the user's main chat history.
-    temp_chat_session = client.new_chat(
-      system_prompt=system_prompt,
-      model=client.config.default_model # Use a reliable default model for this task
+    # Cleaning is stateless, so a one-off message list stands in for a chat session.
+    # It goes straight to the raw completion, which is neither cached nor cleaned
+    # again, so this call cannot recurse back into the cleaner.
+    messages = [_AI_CLEANER_SYSTEM_MESSAGE, {"role": "user", "content": text_to_clean}]
+    cleaned_text = await client.chat._complete(
+      messages,
+      client.config.default_model # Use a reliable default model for this task
     )
-    cleaned_text = await temp_chat_session.generate(text_to_clean)
     return cleaned_text
   except Exception as e:
-    logger.warning(f"AI response cleaning failed: {e}. Falling back to programmatic cleaning.")
+    logger.warning("AI response cleaning failed: %s. Falling back to programmatic cleaning.", e)
     # Fallback to the rule-based cleaner if the AI call fails
     return _clean_response_programmatic(text_to_clean)